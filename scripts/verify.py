@@ -3,6 +3,7 @@ import sys
 import os
 import json
 import re
+import string
 import subprocess
 
 from util import get_bool_environ
@@ -41,18 +42,26 @@ STATEMENT_DIR = os.environ.get('STATEMENT_DIR')
 def get_relative(full_path):
     return full_path[len(BASE_DIR)+1:] if full_path.startswith(BASE_DIR) else full_path
 
+PROBLEM_JSON_RELATIVE = get_relative(PROBLEM_JSON)
+SOLUTIONS_JSON_RELATIVE = get_relative(SOLUTIONS_JSON)
 GEN_DATA_RELATIVE = get_relative(GEN_DATA)
 SUBTASKS_JSON_RELATIVE = get_relative(SUBTASKS_JSON)
 
+STATEMENT_MD = os.path.join(STATEMENT_DIR, 'index.md')
+
 #TODO read these variables from problem.json
 has_markdown_statement = True
 
 git_enabled = True
 git_remote_name = "origin"
 
-valid_problem_types = ('Batch', 'Communication', 'OutputOnly', 'TwoSteps')
+valid_problem_types_ordered = ('Batch', 'Communication', 'OutputOnly', 'TwoSteps')
+valid_problem_types = frozenset(valid_problem_types_ordered)
+valid_problem_types_text = '/'.join(valid_problem_types_ordered)
 model_solution_verdict = 'model_solution'
-valid_verdicts = (model_solution_verdict, 'correct', 'time_limit', 'memory_limit', 'incorrect', 'runtime_error', 'failed', 'time_limit_and_runtime_error', 'partially_correct')
+valid_verdicts_ordered = (model_solution_verdict, 'correct', 'time_limit', 'memory_limit', 'incorrect', 'runtime_error', 'failed', 'time_limit_and_runtime_error', 'partially_correct')
+valid_verdicts = frozenset(valid_verdicts_ordered)
+valid_verdicts_text = '/'.join(valid_verdicts_ordered)
 
 necessary_files = [
     os.path.join(VALIDATOR_DIR, 'Makefile'),
@@ -114,11 +123,11 @@ class Verification:
 
     @classmethod
     def error(cls, description):
-        cls.errors.append('ERROR: {} - {}'.format(cls.namespace, description))
+        cls.errors.append('ERROR: ' + cls.namespace + ' - ' + description)
 
     @classmethod
     def warning(cls, description):
-        cls.warnings.append('WARNING: {} - {}'.format(cls.namespace, description))
+        cls.warnings.append('WARNING: ' + cls.namespace + ' - ' + description)
 
     @classmethod
     def report(cls):
@@ -143,16 +152,13 @@ def warning(description):
 
 
 def check_keys(data, required_keys, json_name=None):
-    key_not_found = False
-    for key in required_keys:
-        if key not in data:
-            if json_name:
-                error('{} is required in {}'.format(key, json_name))
-            else:
-                error('{} is required'.format(key))
-            key_not_found = True
-    if key_not_found:
-        raise KeyError
+    missing_keys = [key for key in required_keys if key not in data]
+    if not missing_keys:
+        return
+    location = ' in ' + json_name if json_name else ''
+    for key in missing_keys:
+        error(key + ' is required' + location)
+    raise KeyError
 
 
 def error_on_duplicate_keys(ordered_pairs):
@@ -183,16 +189,51 @@ def load_data(json_file, required_keys=()):
     return data
 
 
+ignored_file_endings = ('.exe', '.class', '~', '.compile.out')
+
 def has_ending(file_name, endings):
-    if isinstance(endings, string_types):
-        endings = [endings]
-    return any(file_name.endswith(ending) for ending in endings)
+    if not isinstance(endings, string_types):
+        endings = tuple(endings)
+    return file_name.endswith(endings)
 
 def is_ignored(file_name):
-    return has_ending(file_name, ['.exe', '.class', '~', '.compile.out'])
+    return file_name.endswith(ignored_file_endings)
+
+placeholder_formatter = string.Formatter()
+
+def get_placeholder_names(template):
+    # Field names in template, including those nested in format specs.
+    names = []
+    for _, field_name, format_spec, _ in placeholder_formatter.parse(template):
+        if field_name is not None:
+            names.append(field_name)
+            names += get_placeholder_names(format_spec)
+    return names
+
+directory_listings = dict()
+
+def scan_directory(directory):
+    # Returns the names in directory and the names of regular files (or links to them) among them.
+    # Python 2 has no os.scandir, so the file types are not known there (None).
+    if not hasattr(os, 'scandir'):
+        return frozenset(os.listdir(directory)), None
+    entries = list(os.scandir(directory))
+    return frozenset(entry.name for entry in entries), frozenset(entry.name for entry in entries if entry.is_file())
+
+def get_directory_listing(directory):
+    directory = os.path.normpath(directory)
+    if directory not in directory_listings:
+        directory_listings[directory] = scan_directory(directory)
+    return directory_listings[directory]
 
 def get_list_of_files(directory):
-    return list(os.listdir(directory))
+    return get_directory_listing(directory)[0]
+
+def is_regular_file(directory, file_name):
+    names, regular_files = get_directory_listing(directory)
+    if regular_files is not None:
+        return file_name in regular_files
+    return file_name in names and os.path.isfile(os.path.join(directory, file_name))
 
 
 def verify_problem():
@@ -207,12 +248,10 @@ def verify_problem():
         if not git_enabled or WEB_TERMINAL:
             return
         try:
-            subprocess.check_output(["git", "--version"], stderr=subprocess.STDOUT)
-        except subprocess.CalledProcessError:
+            subprocess.check_output(["git", "rev-parse", "--git-dir"], stderr=subprocess.STDOUT)
+        except OSError:
             warning('git command is not available')
             return
-        try:
-            subprocess.check_output(["git", "status"], stderr=subprocess.STDOUT)
         except subprocess.CalledProcessError:
             warning('not a git repository')
             return
@@ -237,26 +276,27 @@ def verify_problem():
 
     if has_markdown_statement:
         try:
-            with open(os.path.join(STATEMENT_DIR, 'index.md'), 'r') as f:
-                first_line = None
-                for line in f.readlines():
-                    if line.strip() != '':
-                        first_line = line
-                        break
-
-                if first_line is None:
-                    warning('statement is empty')
-                elif not first_line.strip().startswith('#'):
-                    warning('statement does not start with a title')
-                else:
-                    statement_title = first_line.replace('#', '').strip()
-                    if statement_title != problem['title']:
-                        warning('title (%s) does not match title in statement (%s)' % (problem['title'], statement_title))
-        except IOError:
+            first_line = None
+            if os.stat(STATEMENT_MD).st_size > 0:
+                with open(STATEMENT_MD, 'r') as f:
+                    for line in f:
+                        if line.strip() != '':
+                            first_line = line
+                            break
+
+            if first_line is None:
+                warning('statement is empty')
+            elif not first_line.strip().startswith('#'):
+                warning('statement does not start with a title')
+            else:
+                statement_title = first_line.replace('#', '').strip()
+                if statement_title != problem['title']:
+                    warning('title (%s) does not match title in statement (%s)' % (problem['title'], statement_title))
+        except (IOError, OSError):
             warning('statement does not exist')
 
     if not isinstance(problem['type'], string_types) or problem['type'] not in valid_problem_types:
-        error('type should be one of {}'.format('/'.join(valid_problem_types)))
+        error('type should be one of {}'.format(valid_problem_types_text))
 
     if 'has_grader' in problem:
         if not isinstance(problem['has_grader'], bool):
@@ -332,7 +372,7 @@ def verify_subtasks():
             if not isinstance(validator_cmd_line, string_types):
                 error('{} validator #{} is not a string{}'.format(name, index+1, parLoc))
                 continue
-            validator_cmd = validator_cmd_line.split(' ')[0]
+            validator_cmd = validator_cmd_line.partition(' ')[0]
             if '.' in validator_cmd:
                 if validator_cmd not in validator_files:
                     error('File not found for {} validator "{}"{}'.format(name, validator_cmd, parLoc))
@@ -344,17 +384,15 @@ def verify_subtasks():
     check_validator_key(subtasks_data, k_sub, 'subtask-sensitive')
 
     subtask_placeholder_var = "subtask"
-    subtask_placeholder_substitute = "___SUBTASK_PLACEHOLDER_SUBSTITUTE___"
     for subtask_sensitive_validator in subtasks_data.get(k_sub, []):
-        try:
-            subtask_validator_substituted = subtask_sensitive_validator.format(**{
-                subtask_placeholder_var : subtask_placeholder_substitute
-            })
-        except KeyError as e:
-            error('Subtask-sensitive validator "{}" contains unknown placeholder {{{}}}.'.format(subtask_sensitive_validator, e.args[0]))
-        else:
-            if subtask_placeholder_substitute not in subtask_validator_substituted:
-                error('Subtask-sensitive validator "{}" does not contain the subtask placeholder {{{}}}.'.format(subtask_sensitive_validator, subtask_placeholder_var))
+        if not isinstance(subtask_sensitive_validator, string_types):
+            continue
+        placeholders = get_placeholder_names(subtask_sensitive_validator)
+        unknown_placeholders = [p for p in placeholders if p != subtask_placeholder_var]
+        if unknown_placeholders:
+            error('Subtask-sensitive validator "{}" contains unknown placeholder {{{}}}.'.format(subtask_sensitive_validator, unknown_placeholders[0]))
+        elif subtask_placeholder_var not in placeholders:
+            error('Subtask-sensitive validator "{}" does not contain the subtask placeholder {{{}}}.'.format(subtask_sensitive_validator, subtask_placeholder_var))
 
     subtasks = subtasks_data['subtasks']
     hasSamples = False
@@ -380,18 +418,19 @@ def verify_subtasks():
 
         indexes.add(data['index'])
 
-        if not isinstance(data['score'], int) or data['score'] < 0:
+        score = data['score']
+        if not isinstance(score, int) or score < 0:
             error('score should be a non-negative integer in subtask {}'.format(name))
         elif name == 'samples':
-            if data['score'] != 0:
+            if score != 0:
                 error('samples subtask score is non-zero')
         else:
-            score_sum += data['score']
+            score_sum += score
 
         check_validator_key(data, 'validators', 'subtask', name)
 
-    for unused_validator in set(validator_files) - used_validators - {'Makefile'}:
-        if not is_ignored(unused_validator) and not has_ending(unused_validator, [".h"]):
+    for unused_validator in validator_files - used_validators - {'Makefile'}:
+        if not is_ignored(unused_validator) and not has_ending(unused_validator, '.h'):
             warning('Unused validator file "{}"'.format(unused_validator))
 
     if score_sum != 100:
@@ -470,7 +509,7 @@ def verify_gen_data(subtasks):
 
 def verify_verdict(verdict, key_name):
     if not isinstance(verdict, string_types) or verdict not in valid_verdicts:
-        error('{} verdict should be one of {}'.format(key_name, '/'.join(valid_verdicts)))
+        error('{} verdict should be one of {}'.format(key_name, valid_verdicts_text))
         return False
     return True
 
@@ -482,13 +521,11 @@ def verify_solutions(subtasks):
 
     model_solution = None
     solution_files = get_list_of_files(SOLUTION_DIR)
-    used_solutions = set()
 
     for solution in solutions:
         if solution not in solution_files:
             error('{} does not exist'.format(solution))
             continue
-        used_solutions.add(solution)
 
         data = solutions[solution]
 
@@ -517,28 +554,39 @@ def verify_solutions(subtasks):
     if model_solution is None:
         error('there is no model solution')
 
-    for unused_solution in set(solution_files) - used_solutions:
+    for unused_solution in solution_files.difference(solutions):
         if not is_ignored(unused_solution):
             warning('{} is not represented'.format(unused_solution))
 
     return solutions
 
 
+def get_missing_files(files):
+    unreadable_directories = set()
+    missing_files = []
+    for file in files:
+        directory, file_name = os.path.split(os.path.join(BASE_DIR, file))
+        found = False
+        if directory not in unreadable_directories:
+            try:
+                found = is_regular_file(directory, file_name)
+            except OSError:
+                unreadable_directories.add(directory)
+        if not found:
+            missing_files.append(get_relative(file))
+    return missing_files
+
 def verify_existence(files):
-    for file0 in files:
-        file = get_relative(file0)
-        if not os.path.isfile(os.path.join(BASE_DIR, file)):
-            error(file)
+    for file in get_missing_files(files):
+        error(file)
 
 def verify_existence_warn(files):
-    for file0 in files:
-        file = get_relative(file0)
-        if not os.path.isfile(os.path.join(BASE_DIR, file)):
-            warning(file)
+    for file in get_missing_files(files):
+        warning(file)
 
 
 def verify():
-    Verification.namespace = get_relative(PROBLEM_JSON)
+    Verification.namespace = PROBLEM_JSON_RELATIVE
     Verification.problem = verify_problem()
 
     Verification.namespace = SUBTASKS_JSON_RELATIVE
@@ -547,7 +595,7 @@ def verify():
     Verification.namespace = GEN_DATA_RELATIVE
     verify_gen_data(subtasks)
 
-    Verification.namespace = get_relative(SOLUTIONS_JSON)
+    Verification.namespace = SOLUTIONS_JSON_RELATIVE
     verify_solutions(subtasks)
 
     Verification.namespace = 'not found'